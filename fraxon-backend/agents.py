@@ -1,7 +1,8 @@
 import os
 import json
-import time
 from . import utils
+from .cancellation import CancellationToken
+from .scheduler import llm_scheduler
 
 
 def _normalize_graph(graph: dict) -> dict:
@@ -110,15 +111,19 @@ def _normalize_graph(graph: dict) -> dict:
 
 
 # --- Placeholder for a real LLM API call ---
-def call_llm_api(prompt, max_retries=3):
+def call_llm_api(prompt, max_retries=3, token=None):
     """
     This is a placeholder function to simulate a call to an LLM API.
     In a real application, you would replace this with a call to Gemini, OpenAI, etc.
+    If a cancellation token is given, the request is abandoned as soon as it is cancelled;
+    a real client should also cap its HTTP timeout at token.remaining().
     """
+    token = token or CancellationToken()
+    token.check()
     print("\n----- Sending Instruction -----")
     print(prompt)
     print("---------------------------------")
-    time.sleep(2)
+    token.wait(2)
 
     # --- SIMULATED RESPONSES ---
     if "Mongoose schema and model file for a schema named \"User\"" in prompt:
@@ -221,15 +226,18 @@ module.exports = router;
 class ArchitectAgent:
     """Deterministic agent for scaffolding the project."""
 
-    def __init__(self, graph_state):
+    def __init__(self, graph_state, token=None):
         self.graph = _normalize_graph(graph_state)
         self.project_name = self.graph.get("projectName", "my-express-app")
         self.project_path = os.path.join(os.getcwd(), "projects",self.project_name)
+        self.token = token or CancellationToken()
 
     def run(self):
         print(f"\nARCHITECT: Scaffolding project '{self.project_name}'...")
+        self.token.check()
         utils.clean_project_directory(self.project_path)
         self._create_project_directories()
+        self.token.check()
         self._create_boilerplate_files()
         print("ARCHITECT: Project scaffolding complete.")
         return self.project_path
@@ -266,10 +274,13 @@ class ArchitectAgent:
 class LLMCoderAgent:
     """AI-powered agent for writing application logic."""
 
-    def __init__(self, graph_state, project_path):
+    def __init__(self, graph_state, project_path, token=None, tenant=None, priority="interactive"):
         self.graph = _normalize_graph(graph_state)
         self.project_path = project_path
         self.src_path = os.path.join(self.project_path, "src")
+        self.token = token or CancellationToken()
+        self.tenant = tenant or self.graph.get("projectName", "my-express-app")
+        self.priority = priority
 
     def run(self):
         print("\nLLM CODER: Generating application logic...")
@@ -279,6 +290,10 @@ class LLMCoderAgent:
         self._link_routes_to_app()
         print("LLM CODER: Application logic generation complete.")
 
+    def _call_llm(self, prompt):
+        # All LLM traffic goes through the shared scheduler so one large graph cannot take every slot
+        return llm_scheduler.submit(call_llm_api, prompt, tenant=self.tenant, priority=self.priority, token=self.token)
+
     def _create_models(self):
         for schema in self.graph.get("schemas", []):
             fields_description = "\n".join([
@@ -287,7 +302,8 @@ class LLMCoderAgent:
             hooks_description = f"\nAdditionally, implement a 'pre-save' hook. The logic for this hook is: \"{schema['hooks']['pre-save']}\"" if schema.get(
                 "hooks") and schema["hooks"].get("pre-save") else ""
             prompt = f"""You are an expert Node.js developer specializing in Mongoose. Write a complete Mongoose schema and model file for a schema named "{schema['name']}". The fields are:\n{fields_description}{hooks_description}\nYour response should be only the JavaScript code."""
-            raw_code = call_llm_api(prompt)
+            raw_code = self._call_llm(prompt)
+            self.token.check()
             cleaned_code = utils.clean_llm_code_output(raw_code)
             utils.create_file(os.path.join(self.src_path, "models", f"{schema['name'].lower()}.model.js"), cleaned_code)
 
@@ -310,9 +326,10 @@ class LLMCoderAgent:
 **Context:** It uses a Mongoose model named `{controller['schema']}`.
 **Logic to Implement:** "{controller['logic']}"
 Your response should be only the JavaScript code for this one function, without the model import."""
-                raw_code = call_llm_api(prompt)
+                raw_code = self._call_llm(prompt)
                 full_controller_code += "\n" + utils.clean_llm_code_output(raw_code)
 
+            self.token.check()
             utils.create_file(os.path.join(self.src_path, "controllers", f"{schema_name.lower()}.controller.js"),
                               full_controller_code)
 
@@ -337,11 +354,13 @@ Your response should be only the JavaScript code for this one function, without
 - Define the following routes:\n{routes_description}
 - Export the router.
 Your response must be only the JavaScript code."""
-            raw_code = call_llm_api(prompt)
+            raw_code = self._call_llm(prompt)
+            self.token.check()
             cleaned_code = utils.clean_llm_code_output(raw_code)
             utils.create_file(os.path.join(self.src_path, "routes", f"{group_name}.routes.js"), cleaned_code)
 
     def _link_routes_to_app(self):
+        self.token.check()
         app_js_path = os.path.join(self.src_path, "app.js")
         with open(app_js_path, 'r') as f:
             content = f.read()
@@ -362,12 +381,14 @@ Your response must be only the JavaScript code."""
 class DocumenterAgent:
     """Agent for creating documentation."""
 
-    def __init__(self, graph_state, project_path):
+    def __init__(self, graph_state, project_path, token=None):
         self.graph = _normalize_graph(graph_state)
         self.project_path = project_path
+        self.token = token or CancellationToken()
 
     def run(self):
         print("\nDOCUMENTER: Creating project documentation...")
+        self.token.check()
         self._create_readme()
         print("DOCUMENTER: Documentation created.")
 
@@ -409,5 +430,6 @@ This API was auto-generated by a multi-agent system.
 ---
 {schemas_md}
 """
+        self.token.check()
         utils.create_file(os.path.join(self.project_path, "README.md"), readme_content)
 
@@ -0,0 +1,111 @@
+import math
+import threading
+import time
+
+
+class GenerationCancelled(Exception):
+    """Raised when a run is cancelled, superseded or runs past its deadline."""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag with an optional overall deadline.
+    Long-running steps call check() between units of work and wait() instead of time.sleep().
+    """
+
+    def __init__(self, timeout: float | None = None):
+        self._event = threading.Event()
+        self._released = threading.Event()
+        self.reason = None
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+        return self._event.is_set()
+
+    def remaining(self) -> float | None:
+        """Seconds left before the deadline, or None when there is no deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled(self.reason)
+
+    def wait(self, seconds: float) -> None:
+        """Sleeps for up to `seconds`, waking early (and raising) if the token is cancelled."""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._event.wait(seconds)
+        self.check()
+
+
+def parse_deadline(value) -> float | None:
+    """
+    Validates a client-supplied deadline in seconds (e.g. a deadlineSeconds body field).
+    Returns None when absent; raises ValueError unless it is a finite positive number.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+        raise ValueError("deadlineSeconds must be a positive number of seconds")
+    return float(value)
+
+
+# --- Active runs, keyed by e.g. project name, so a newer submission supersedes an older one ---
+_active_lock = threading.Lock()
+_active: dict[str, CancellationToken] = {}
+
+
+def register_run(key: str, token: CancellationToken, wait: float = 30) -> None:
+    """
+    Registers `token` as the active run for `key`, cancelling any run it replaces and
+    waiting up to `wait` seconds for that run to release, so the two never touch the same files.
+    """
+    with _active_lock:
+        previous = _active.get(key)
+        _active[key] = token
+    if previous is not None and previous is not token:
+        print(f"SUPERSEDED: previous run for '{key}'")
+        previous.cancel("superseded")
+        previous._released.wait(wait)
+        token.check()
+
+
+def is_active_run(key: str, token: CancellationToken) -> bool:
+    """True while `token` is still the registered run for `key`, i.e. it still owns the key's output."""
+    with _active_lock:
+        return _active.get(key) is token
+
+
+def release_run(key: str, token: CancellationToken) -> bool:
+    """Releases `token`'s registration. Returns whether it was still the active run for `key`."""
+    with _active_lock:
+        owned = _active.get(key) is token
+        if owned:
+            del _active[key]
+    token._released.set()
+    return owned
+
+
+def cancel_run(key: str, reason: str = "cancelled") -> bool:
+    """Cancels the active run for `key`. Returns False if nothing was running."""
+    with _active_lock:
+        token = _active.get(key)
+    if token is None:
+        return False
+    token.cancel(reason)
+    return True
@@ -1,7 +1,9 @@
 from flask import Blueprint, request
 import os
 
-from ..services.render_deploy_service import deploy_to_render
+from ..services.render_deploy_service import deploy_to_render, deploy_many_to_render
+from ..cancellation import CancellationToken, GenerationCancelled, parse_deadline
+from .. import utils
 
 
 deploy_render_bp = Blueprint("deploy_render", __name__)
@@ -13,14 +15,50 @@ def deploy_render():
     project_name = body.get("projectName") or os.getenv("PROJECT_NAME", "generated-api")
 
     project_root = os.path.join(os.getcwd(), "projects", "generated-api")
+    try:
+        deadline = parse_deadline(body.get("deadlineSeconds"))
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    token = CancellationToken(timeout=deadline) if deadline else None
 
     try:
         result = deploy_to_render(
             project_root,
             project_name=project_name,
+            token=token,
         )
         return result, 200
+    except GenerationCancelled as e:
+        return {"message": "Deployment cancelled", "reason": e.reason}, 409
     except Exception as e:
         return {"message": "Deployment failed", "error": str(e)}, 500
 
 
+@deploy_render_bp.post("/deploy/render/batch")
+def deploy_render_batch():
+    body = request.get_json(silent=True) or {}
+    projects = body.get("projects")
+    if not isinstance(projects, list) or not projects:
+        return {"message": "projects must be a non-empty list of project names"}, 400
+    names = [p.get("projectName") if isinstance(p, dict) else p for p in projects]
+    for name in names:
+        if not utils.is_safe_project_name(name):
+            return {"message": f"Invalid project name: {name!r}"}, 400
+
+    projects = [
+        {"project_root": os.path.join(os.getcwd(), "projects", name), "project_name": name}
+        for name in names
+    ]
+    try:
+        deadline = parse_deadline(body.get("deadlineSeconds"))
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    token = CancellationToken(timeout=deadline) if deadline else None
+
+    try:
+        result = deploy_many_to_render(projects, token=token)
+        return result, 200
+    except GenerationCancelled as e:
+        return {"message": "Deployment cancelled", "reason": e.reason}, 409
+    except Exception as e:
+        return {"message": "Deployment failed", "error": str(e)}, 500
@@ -1,6 +1,9 @@
 from flask import Blueprint, request
 from . import __name__ as routes_name  # ensure package resolution
 from ..services.generation_service import generate_backend
+from ..services.graph_ingestion import GraphValidationError, ingest_generate_request
+from ..cancellation import CancellationToken, GenerationCancelled, cancel_run, parse_deadline
+from ..scheduler import client_priorities
 
 generation_bp = Blueprint("generation", __name__)
 
@@ -8,9 +11,39 @@ generation_bp = Blueprint("generation", __name__)
 @generation_bp.post("/generate")
 def generate():
     print("ENDPOINT HIT")
-    payload = request.get_json(silent=True) or {}
-    graph_state = payload.get("graphState") or payload
-    result = generate_backend(graph_state)
+    try:
+        payload, graph_state, ingest = ingest_generate_request(request.stream, request.content_length)
+    except GraphValidationError as e:
+        return {"message": f"Invalid graphState: {e}", "path": e.path}, 400
+    print(f"INGESTED GRAPH: {ingest}")
+    try:
+        deadline = parse_deadline(payload.get("deadlineSeconds"))
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    token = CancellationToken(timeout=deadline) if deadline else None
+    # Tenant and priority are trusted client input until the app has auth; LLM_CLIENT_PRIORITIES
+    # can withhold classes such as interactive from clients
+    tenant = request.headers.get("X-User-Id") or payload.get("userId")
+    if tenant is not None and (not isinstance(tenant, str) or not tenant.strip()):
+        return {"message": "userId must be a non-empty string"}, 400
+    allowed = client_priorities()
+    priority = payload.get("priority") or (allowed[0] if allowed else None)
+    if priority not in allowed:
+        return {"message": f"priority must be one of {', '.join(allowed)}"}, 400
+    try:
+        result = generate_backend(graph_state, token=token, tenant=tenant, priority=priority)
+    except GenerationCancelled as e:
+        return {"message": "Generation cancelled", "reason": e.reason}, 409
+    result["ingest"] = ingest
     return result, 200
 
 
+@generation_bp.post("/generate/cancel")
+def cancel_generate():
+    body = request.get_json(silent=True) or {}
+    project_name = body.get("projectName")
+    if not project_name:
+        return {"message": "projectName is required"}, 400
+    if not cancel_run(project_name):
+        return {"message": "No generation running", "projectName": project_name}, 404
+    return {"message": "Cancellation requested", "projectName": project_name}, 200
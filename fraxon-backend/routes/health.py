@@ -1,5 +1,7 @@
 from flask import Blueprint
 
+from ..scheduler import llm_scheduler
+
 health_bp = Blueprint("health", __name__)
 
 
@@ -8,3 +10,8 @@ def health():
     return {"status": "healthy"}
 
 
+@health_bp.get("/health/llm")
+def llm_health():
+    return llm_scheduler.stats()
+
+
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .cancellation import CancellationToken
+
+
+# Highest priority first; a class is only served when every class above it is empty
+PRIORITY_CLASSES = ("interactive", "batch", "speculative")
+
+
+def _parse_weights(spec: str) -> dict:
+    """Parses "tenantA=2,tenantB=0.5" into {tenant: weight}; weights must be positive."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        tenant, _, value = item.partition("=")
+        try:
+            weight = float(value)
+        except ValueError:
+            weight = 0
+        if not tenant.strip() or not 0 < weight < float("inf"):
+            raise ValueError(f"Invalid LLM_TENANT_WEIGHTS entry: {item!r} (expected tenant=positive number)")
+        weights[tenant.strip()] = weight
+    return weights
+
+
+def client_priorities() -> tuple:
+    """Priority classes a client may request, from LLM_CLIENT_PRIORITIES (defaults to all)."""
+    allowed = [p.strip() for p in os.getenv("LLM_CLIENT_PRIORITIES", ",".join(PRIORITY_CLASSES)).split(",")]
+    return tuple(p for p in PRIORITY_CLASSES if p in allowed)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for fairness and rate budgeting."""
+    return max(1, len(text or "") // 4)
+
+
+class _Ticket:
+    __slots__ = ("tenant", "priority", "cost", "enqueued_at", "granted")
+
+    def __init__(self, tenant, priority, cost):
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.enqueued_at = time.monotonic()
+        self.granted = threading.Event()
+
+
+class _Lane:
+    """Per-tenant queue inside one priority class, with its deficit round robin counter."""
+
+    __slots__ = ("queue", "deficit", "topped_up")
+
+    def __init__(self):
+        self.queue = deque()
+        self.deficit = 0
+        self.topped_up = False
+
+
+class LLMScheduler:
+    """
+    Central gate in front of the LLM API.
+    Requests queue per tenant (user or project) within a priority class and are released by
+    deficit round robin, weighted by token cost, under a global concurrency limit and an
+    optional tokens-per-minute budget. Callers block in submit() until their turn.
+    Tenants without an entry in `weights` (LLM_TENANT_WEIGHTS) get weight 1.
+    """
+
+    def __init__(self, max_concurrency=4, tokens_per_minute=0, quantum=500, weights=None):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.quantum = quantum
+        self.weights = dict(weights or {})
+        self._lock = threading.Lock()
+        self._rings = {p: OrderedDict() for p in PRIORITY_CLASSES}
+        self._running = 0
+        self._usage = deque()  # (timestamp, tokens) within the last minute
+        self._waits = {p: deque(maxlen=500) for p in PRIORITY_CLASSES}
+        self._served = {p: 0 for p in PRIORITY_CLASSES}
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+            tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+            quantum=int(os.getenv("LLM_SCHEDULER_QUANTUM", "500")),
+            weights=_parse_weights(os.getenv("LLM_TENANT_WEIGHTS", "")),
+        )
+
+    def submit(self, fn, prompt, *, tenant="default", priority="interactive", token=None, **kwargs):
+        """Waits for a slot, then calls fn(prompt, token=token, **kwargs) and returns its result."""
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        token = token or CancellationToken()
+        self._acquire(tenant, priority, estimate_tokens(prompt), token)
+        try:
+            result = fn(prompt, token=token, **kwargs)
+            if isinstance(result, str):
+                self._record_usage(estimate_tokens(result))
+            return result
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            queues = {}
+            for priority, ring in self._rings.items():
+                queues[priority] = {
+                    "depth": sum(len(lane.queue) for lane in ring.values()),
+                    "tenants": {tenant: len(lane.queue) for tenant, lane in ring.items()},
+                }
+            waits = {}
+            for priority, samples in self._waits.items():
+                ordered = sorted(samples) or [0.0]
+                waits[priority] = {
+                    "served": self._served[priority],
+                    "avgMs": round(sum(ordered) / len(ordered) * 1000, 1),
+                    "p95Ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+                    "maxMs": round(ordered[-1] * 1000, 1),
+                }
+            self._trim_usage(time.monotonic())
+            return {
+                "running": self._running,
+                "maxConcurrency": self.max_concurrency,
+                "tokensLastMinute": sum(n for _, n in self._usage),
+                "tokensPerMinute": self.tokens_per_minute,
+                "queues": queues,
+                "waits": waits,
+            }
+
+    # --- Internals ---
+
+    def _acquire(self, tenant, priority, cost, token):
+        # Never let a single prompt exceed the whole budget, or it could never be served
+        if self.tokens_per_minute:
+            cost = min(cost, self.tokens_per_minute)
+        ticket = _Ticket(tenant, priority, cost)
+        with self._lock:
+            ring = self._rings[priority]
+            lane = ring.get(tenant)
+            if lane is None:
+                lane = ring[tenant] = _Lane()
+            lane.queue.append(ticket)
+            self._dispatch()
+        # Wake up periodically so the token budget refills and cancellation is noticed
+        while not ticket.granted.wait(0.1):
+            with self._lock:
+                if token.cancelled and not ticket.granted.is_set():
+                    self._withdraw(ticket)
+                    break
+                self._dispatch()
+        if not ticket.granted.is_set():
+            # Withdrawn before a slot was granted, so there is nothing to release
+            token.check()
+
+    def _release(self):
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    def _record_usage(self, tokens):
+        with self._lock:
+            self._usage.append((time.monotonic(), tokens))
+
+    # _withdraw, _trim_usage, _dispatch and _pick expect self._lock to be held
+
+    def _withdraw(self, ticket):
+        ring = self._rings[ticket.priority]
+        lane = ring.get(ticket.tenant)
+        if lane is not None and ticket in lane.queue:
+            lane.queue.remove(ticket)
+            if not lane.queue:
+                del ring[ticket.tenant]
+
+    def _trim_usage(self, now):
+        while self._usage and now - self._usage[0][0] >= 60:
+            self._usage.popleft()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._running < self.max_concurrency:
+            if self.tokens_per_minute:
+                self._trim_usage(now)
+                if sum(n for _, n in self._usage) >= self.tokens_per_minute:
+                    return
+            ticket = self._pick()
+            if ticket is None:
+                return
+            self._running += 1
+            self._usage.append((now, ticket.cost))
+            self._waits[ticket.priority].append(now - ticket.enqueued_at)
+            self._served[ticket.priority] += 1
+            ticket.granted.set()
+
+    def _pick(self):
+        for priority in PRIORITY_CLASSES:
+            ring = self._rings[priority]
+            while ring:
+                tenant, lane = next(iter(ring.items()))
+                if not lane.topped_up:
+                    lane.deficit += self.quantum * self.weights.get(tenant, 1)
+                    lane.topped_up = True
+                ticket = lane.queue[0]
+                if ticket.cost <= lane.deficit:
+                    lane.deficit -= ticket.cost
+                    lane.queue.popleft()
+                    if not lane.queue:
+                        del ring[tenant]
+                    return ticket
+                # Out of credit this round; move on to the next tenant
+                lane.topped_up = False
+                ring.move_to_end(tenant)
+        return None
+
+
+llm_scheduler = LLMScheduler.from_env()
@@ -1,34 +1,62 @@
-import json
+import os
 from ..agents import ArchitectAgent, LLMCoderAgent, DocumenterAgent
-
-
-def generate_backend(graph_state: dict) -> dict:
-    print("PRINT GRAPH:",graph_state)
+from ..cancellation import CancellationToken, GenerationCancelled, is_active_run, register_run, release_run
+from .. import utils
+from .graph_ingestion import parse_graph
+
+
+def generate_backend(
+    graph_state: dict,
+    token: CancellationToken | None = None,
+    *,
+    tenant: str | None = None,
+    priority: str = "interactive",
+) -> dict:
+    """
+    Runs the architect, coder and documenter agents for one graph.
+    A newer call for the same project cancels this one; on cancellation or deadline,
+    GenerationCancelled is raised and any partial output is removed.
+    LLM calls are queued under `tenant` (defaults to the project name) at `priority`.
+    """
     if not isinstance(graph_state, dict):
-        try:
-            graph_state = json.loads(graph_state)
-        except Exception:
+        if not isinstance(graph_state, (str, bytes)):
             raise ValueError("graphState must be an object or JSON string")
+        # Size/depth limited and shape checked; raises GraphValidationError (a ValueError)
+        graph_state = parse_graph(graph_state)
+    print(f"GENERATING: '{graph_state.get('projectName')}' with {len(graph_state.get('schemas') or [])} schemas")
+
+    if token is None:
+        timeout = float(os.getenv("GENERATION_DEADLINE_SECONDS", "0")) or None
+        token = CancellationToken(timeout=timeout)
+
+    architect = ArchitectAgent(graph_state, token=token)
+    try:
+        # Waits for a superseded run to unwind before the architect wipes the directory
+        register_run(architect.project_name, token)
+        project_path = architect.run()
 
-    architect = ArchitectAgent(graph_state)
-    project_path = architect.run()
+        print("start coding...")
 
-    print("start coding...")
-    
 
-    coder = LLMCoderAgent(graph_state, project_path)
-    coder.run()
+        coder = LLMCoderAgent(graph_state, project_path, token=token, tenant=tenant, priority=priority)
+        coder.run()
 
-    
-    print("done coding...")
 
-    documenter = DocumenterAgent(graph_state, project_path)
-    documenter.run()
+        print("done coding...")
+
+        documenter = DocumenterAgent(graph_state, project_path, token=token)
+        documenter.run()
+    except GenerationCancelled as e:
+        print(f"GENERATION CANCELLED: '{architect.project_name}' ({e.reason})")
+        # Clean up only while still registered; a newer run waits on our release before scaffolding
+        if is_active_run(architect.project_name, token):
+            utils.clean_project_directory(architect.project_path)
+        raise
+    finally:
+        release_run(architect.project_name, token)
 
     return {
         "message": "Multi-agent backend generation complete",
         "projectPath": project_path,
         "projectName": graph_state.get("projectName"),
     }
-
-
@@ -0,0 +1,200 @@
+import json
+import os
+import sys
+import time
+from typing import Any, BinaryIO, Dict, Tuple
+
+from .. import utils
+
+
+_NON_BRACKETS = bytes(b for b in range(256) if b not in b"[]{}")
+
+# Short strings (field types, schema/controller names, HTTP methods) repeat across the graph
+_INTERN_MAX_LEN = 64
+
+
+class GraphValidationError(ValueError):
+    """Raised when a graphState payload is too large, too deep, malformed or has the wrong shape."""
+
+    def __init__(self, message: str, path: str = "$"):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+        self.detail = message
+
+
+def _limits() -> Dict[str, int]:
+    return {
+        "max_bytes": int(os.getenv("GRAPH_MAX_BYTES", str(5 * 1024 * 1024))),
+        "max_depth": int(os.getenv("GRAPH_MAX_DEPTH", "32")),
+        "chunk_size": int(os.getenv("GRAPH_READ_CHUNK", str(64 * 1024))),
+    }
+
+
+class _DepthScanner:
+    """Tracks JSON nesting depth chunk by chunk, so over-deep input fails before it is parsed."""
+
+    def __init__(self, max_depth: int):
+        self.max_depth = max_depth
+        self.depth = 0
+        self.offset = 0
+        self.in_string = False
+        self.carry = b""
+
+    def feed(self, chunk: bytes) -> None:
+        data = self.carry + chunk
+        # Blank out escape pairs (same length) so every remaining quote delimits a string
+        clean = data.replace(b"\\\\", b"  ").replace(b'\\"', b"  ")
+        # A lone trailing backslash escapes the first byte of the next chunk
+        self.carry = b"\\" if clean.endswith(b"\\") else b""
+        if self.carry:
+            clean = clean[:-1]
+
+        parts = clean.split(b'"')
+        outside = parts[1::2] if self.in_string else parts[0::2]
+        if len(parts) % 2 == 0:
+            self.in_string = not self.in_string
+
+        for c in b"".join(outside).translate(None, _NON_BRACKETS):
+            if c in (0x7B, 0x5B):
+                self.depth += 1
+                if self.depth > self.max_depth:
+                    raise GraphValidationError(
+                        f"nesting deeper than {self.max_depth} levels within the first {self.offset + len(chunk)} bytes"
+                    )
+            else:
+                self.depth -= 1
+        self.offset += len(chunk)
+
+
+def _intern_pairs(pairs):
+    return {
+        sys.intern(k): sys.intern(v) if isinstance(v, str) and len(v) <= _INTERN_MAX_LEN else v
+        for k, v in pairs
+    }
+
+
+def _decode(raw: bytes | bytearray | str) -> Any:
+    try:
+        return json.loads(raw, object_pairs_hook=_intern_pairs)
+    except json.JSONDecodeError as e:
+        raise GraphValidationError(f"invalid JSON: {e.msg} at line {e.lineno} column {e.colno}")
+    except UnicodeDecodeError:
+        raise GraphValidationError("body is not valid UTF-8")
+    except RecursionError:
+        raise GraphValidationError("nesting too deep")
+
+
+def read_json_stream(stream: BinaryIO, content_length: int | None = None) -> Tuple[Any, int]:
+    """
+    Reads a JSON body in chunks, enforcing GRAPH_MAX_BYTES and GRAPH_MAX_DEPTH as it goes,
+    then decodes it in one json.loads call. Only the size and depth checks are incremental:
+    the raw body (at most GRAPH_MAX_BYTES) is buffered once, and that cap is what bounds memory.
+    Returns the decoded value and the number of bytes read.
+    """
+    limits = _limits()
+    if content_length is not None and content_length > limits["max_bytes"]:
+        raise GraphValidationError(f"body of {content_length} bytes exceeds the {limits['max_bytes']} byte limit")
+
+    scanner = _DepthScanner(limits["max_depth"])
+    buf = bytearray()
+    while True:
+        chunk = stream.read(limits["chunk_size"])
+        if not chunk:
+            break
+        if len(buf) + len(chunk) > limits["max_bytes"]:
+            raise GraphValidationError(f"body exceeds the {limits['max_bytes']} byte limit")
+        scanner.feed(chunk)
+        buf += chunk
+    if not buf:
+        return None, 0
+    # json.loads takes the bytearray as-is; copying it to bytes would double the peak
+    return _decode(buf), len(buf)
+
+
+def _expect(value, kind, path, name):
+    if not isinstance(value, kind):
+        raise GraphValidationError(f"expected {name}, got {type(value).__name__}", path)
+
+
+def validate_graph(graph: Any) -> Dict[str, Any]:
+    """Checks the graphState shape produced by the editor; raises GraphValidationError with a JSON path."""
+    _expect(graph, dict, "$", "object")
+    if graph.get("projectName") is not None:
+        _expect(graph["projectName"], str, "$.projectName", "string")
+        # It becomes a directory under projects/ that generation may rmtree
+        if not utils.is_safe_project_name(graph["projectName"]):
+            raise GraphValidationError(
+                "must be 1-100 characters, not blank, not start with '.' and contain no path separators",
+                "$.projectName",
+            )
+
+    schemas = graph.get("schemas")
+    schemas = [] if schemas is None else schemas
+    _expect(schemas, list, "$.schemas", "array")
+    for i, schema in enumerate(schemas):
+        path = f"$.schemas[{i}]"
+        _expect(schema, dict, path, "object")
+        if schema.get("name") is not None:
+            _expect(schema["name"], str, f"{path}.name", "string")
+        fields = schema.get("fields")
+        fields = {} if fields is None else fields
+        _expect(fields, dict, f"{path}.fields", "object")
+        for fname, fdef in fields.items():
+            _expect(fdef, dict, f"{path}.fields.{fname}", "object")
+            if fdef.get("type") is not None:
+                _expect(fdef["type"], str, f"{path}.fields.{fname}.type", "string")
+        if schema.get("hooks") is not None:
+            _expect(schema["hooks"], dict, f"{path}.hooks", "object")
+
+    for key, required in (("controllers", ("name",)), ("routes", ("path", "method"))):
+        items = graph.get(key)
+        items = [] if items is None else items
+        _expect(items, list, f"$.{key}", "array")
+        for i, item in enumerate(items):
+            path = f"$.{key}[{i}]"
+            _expect(item, dict, path, "object")
+            for attr in required:
+                if attr in item:
+                    _expect(item[attr], str, f"{path}.{attr}", "string")
+
+    return graph
+
+
+def parse_graph(raw: bytes | str) -> Dict[str, Any]:
+    """Parses a graphState given as JSON text (e.g. a double-encoded field) under the same limits."""
+    limits = _limits()
+    data = raw.encode() if isinstance(raw, str) else raw
+    if len(data) > limits["max_bytes"]:
+        raise GraphValidationError(f"graphState exceeds the {limits['max_bytes']} byte limit", "$.graphState")
+    _DepthScanner(limits["max_depth"]).feed(data)
+    return validate_graph(_decode(data))
+
+
+def ingest_generate_request(stream: BinaryIO, content_length: int | None = None) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """
+    Reads and validates a /generate body. Returns (payload, graph_state, stats) where
+    stats holds the body size and ingestion time; the payload itself is never logged.
+    """
+    started = time.perf_counter()
+    payload, size = read_json_stream(stream, content_length)
+    payload = payload if payload is not None else {}
+    _expect(payload, dict, "$", "object")
+
+    graph_state = payload.get("graphState") or payload
+    try:
+        if isinstance(graph_state, str):
+            graph_state = parse_graph(graph_state)
+        else:
+            validate_graph(graph_state)
+    except GraphValidationError as e:
+        if graph_state is payload or e.path.startswith("$.graphState"):
+            raise
+        raise GraphValidationError(e.detail, e.path.replace("$", "$.graphState", 1))
+
+    stats = {
+        "bytes": size,
+        "ingestMs": round((time.perf_counter() - started) * 1000, 2),
+        "schemas": len(graph_state.get("schemas") or []),
+        "routes": len(graph_state.get("routes") or []),
+    }
+    return payload, graph_state, stats
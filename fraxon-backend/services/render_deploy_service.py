@@ -2,155 +2,356 @@ import os
 import shutil
 import subprocess
 import json
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 import requests
 
+from ..cancellation import CancellationToken, GenerationCancelled, register_run, release_run
 
-def _run(cmd: list[str], cwd: str | None = None) -> None:
-    subprocess.run(cmd, cwd=cwd, check=True)
+
+def _run(cmd: list[str], cwd: str | None = None, token: CancellationToken | None = None) -> None:
+    if token is None:
+        subprocess.run(cmd, cwd=cwd, check=True)
+        return
+    token.check()
+    proc = subprocess.Popen(cmd, cwd=cwd)
+    # Poll so a cancelled or overdue deploy kills the git process instead of waiting on it
+    while True:
+        try:
+            returncode = proc.wait(timeout=0.2)
+            break
+        except subprocess.TimeoutExpired:
+            if token.cancelled:
+                proc.kill()
+                proc.wait()
+                raise GenerationCancelled(token.reason)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def _request_timeout(token: CancellationToken, default: float = 60) -> float:
+    token.check()
+    remaining = token.remaining()
+    return default if remaining is None else max(0.1, min(default, remaining))
 
 
 def deploy_to_render(
     project_root: str,
     *,
     project_name: str | None = None,
+    token: CancellationToken | None = None,
 ) -> Dict[str, Any]:
     """
-    Pushes the given Node project to a repo subfolder and deploys it on Render.
+    Pushes the given Node project to its own subfolder of the shared repo and deploys it on Render.
+    This is a one-project deploy_many_to_render, so other projects in the repo are left intact.
     Returns a dict with push and render API results.
     Values fall back to environment variables if not provided:
       GITHUB_REPO, GITHUB_TOKEN, RENDER_API_KEY, USER_ID
+    A newer deploy of the same project cancels this one; the cancellation token also
+    bounds the git subprocesses and the Render request by its deadline.
     """
     print("START DEPLOY TO RENDER")
     project_name = project_name or os.path.basename(project_root.rstrip("/\\"))
-    owner = os.getenv("GITHUB_OWNER")
-    github_token = os.getenv("GITHUB_TOKEN")
-    render_api_key = os.getenv("RENDER_API_KEY")
-    branch = os.getenv("GIT_BRANCH", "main")
-    region = os.getenv("RENDER_REGION", "oregon")
-    build_command = os.getenv("BUILD_COMMAND", "npm install")
-    start_command = os.getenv("START_COMMAND", "node src/index.js")
-    service_name = os.getenv("RENDER_SERVICE_NAME", project_name)
-
-    if not (owner and github_token and render_api_key):
-        raise ValueError("Missing required credentials: GITHUB_OWNER, GITHUB_TOKEN, RENDER_API_KEY")
+    if token is None:
+        timeout = float(os.getenv("DEPLOY_DEADLINE_SECONDS", "0")) or None
+        token = CancellationToken(timeout=timeout)
+    try:
+        batch = deploy_many_to_render(
+            [{
+                "project_root": project_root,
+                "project_name": project_name,
+                "service_name": os.getenv("RENDER_SERVICE_NAME", project_name),
+            }],
+            token=token,
+        )
+    except GenerationCancelled as e:
+        print(f"DEPLOY CANCELLED: '{project_name}' ({e.reason})")
+        raise
+
+    project = batch["projects"][0]
+    if project["status"] != "deployed":
+        raise RuntimeError(project["error"])
+    result = {
+        "push": batch["push"],
+        "rootDir": project["rootDir"],
+        "render": project["render"],
+    }
+    print(result)
+    return result
 
-    github_repo = f"https://github.com/{owner}/fraxon-projects.git"
-    print("1")
 
-    if not os.path.isdir(project_root):
-        raise FileNotFoundError(f"Project path does not exist: {project_root}")
+def _settings() -> Dict[str, Any]:
+    settings = {
+        "owner": os.getenv("GITHUB_OWNER"),
+        "github_token": os.getenv("GITHUB_TOKEN"),
+        "render_api_key": os.getenv("RENDER_API_KEY"),
+        "branch": os.getenv("GIT_BRANCH", "main"),
+        "region": os.getenv("RENDER_REGION", "oregon"),
+        "build_command": os.getenv("BUILD_COMMAND", "npm install"),
+        "start_command": os.getenv("START_COMMAND", "node src/index.js"),
+    }
+    if not (settings["owner"] and settings["github_token"] and settings["render_api_key"]):
+        raise ValueError("Missing required credentials: GITHUB_OWNER, GITHUB_TOKEN, RENDER_API_KEY")
+    settings["github_repo"] = f"https://github.com/{settings['owner']}/fraxon-projects.git"
+    return settings
+
 
-    clone_dir = os.path.join(os.getcwd(), "temp_repo")
+def _clone_repo(settings: Dict[str, Any], clone_dir: str, token: CancellationToken) -> None:
     print(clone_dir)
     if os.path.exists(clone_dir):
         shutil.rmtree(clone_dir)
 
     # Clone with token in URL
-    clone_url = github_repo.replace("https://", f"https://{github_token}@")
-    print(clone_url)
-    _run(["git", "clone", clone_url, clone_dir])
-    print("2")
+    clone_url = settings["github_repo"].replace("https://", f"https://{settings['github_token']}@")
+    _run(["git", "clone", clone_url, clone_dir], token=token)
 
-    # Ensure branch exists/checked out (especially for empty repos)
+    # Track the remote branch when it exists; otherwise start it (especially for empty repos)
     try:
-        _run(["git", "checkout", "-B", branch], cwd=clone_dir)
-    except Exception:
-        pass
-
-    # Replace repository root contents (except .git) with project contents
-    for item in os.listdir(clone_dir):
-        if item == ".git":
-            continue
-        path = os.path.join(clone_dir, item)
-        if os.path.isdir(path):
-            shutil.rmtree(path)
-        else:
-            os.remove(path)
-    print("3")
+        _run(["git", "checkout", "-B", settings["branch"], f"origin/{settings['branch']}"], cwd=clone_dir, token=token)
+    except subprocess.CalledProcessError:
+        try:
+            _run(["git", "checkout", "-B", settings["branch"]], cwd=clone_dir, token=token)
+        except subprocess.CalledProcessError:
+            pass
 
 
-    # Copy project files into repo root
-    for root, dirs, files in os.walk(project_root):
-        rel = os.path.relpath(root, project_root)
-        target_dir = clone_dir if rel == "." else os.path.join(clone_dir, rel)
+def _copy_tree(src_root: str, dst_root: str, token: CancellationToken) -> None:
+    for root, dirs, files in os.walk(src_root):
+        token.check()
+        rel = os.path.relpath(root, src_root)
+        target_dir = dst_root if rel == "." else os.path.join(dst_root, rel)
         os.makedirs(target_dir, exist_ok=True)
         for f in files:
             src_f = os.path.join(root, f)
             dst_f = os.path.join(target_dir, f)
             shutil.copy2(src_f, dst_f)
 
-    # Commit and push
+
+def _commit_and_push(clone_dir: str, branch: str, message: str, token: CancellationToken) -> None:
     # Configure git identity if not set
     git_user_name = os.getenv("GIT_USER_NAME", "fraxon-bot")
     git_user_email = os.getenv("GIT_USER_EMAIL", "fraxon-bot@example.com")
     try:
-        _run(["git", "config", "user.name", git_user_name], cwd=clone_dir)
-        _run(["git", "config", "user.email", git_user_email], cwd=clone_dir)
+        _run(["git", "config", "user.name", git_user_name], cwd=clone_dir, token=token)
+        _run(["git", "config", "user.email", git_user_email], cwd=clone_dir, token=token)
     except Exception:
         pass
 
-    _run(["git", "add", "."], cwd=clone_dir)
+    _run(["git", "add", "."], cwd=clone_dir, token=token)
     print("git added...")
     # Commit may fail if no changes; ignore that specific case
     try:
-        _run(["git", "commit", "-m", f"Deploy {project_name} app"], cwd=clone_dir)
+        _run(["git", "commit", "-m", message], cwd=clone_dir, token=token)
         print("git commmit...")
     except subprocess.CalledProcessError:
         # no changes to commit
         pass
-    # Ensure upstream and push
-    try:
-        _run(["git", "push", "-u", "origin", branch], cwd=clone_dir)
-    except subprocess.CalledProcessError:
-        _run(["git", "push", "origin", branch], cwd=clone_dir)
+    # Other deploys push to the same repo; on rejection rebase onto their commits and retry.
+    # Projects live in separate subdirectories, so the rebase only conflicts on the same project.
+    attempts = int(os.getenv("GIT_PUSH_ATTEMPTS", "5"))
+    for attempt in range(1, attempts + 1):
+        try:
+            _run(["git", "push", "-u", "origin", branch], cwd=clone_dir, token=token)
+            break
+        except subprocess.CalledProcessError:
+            if attempt == attempts:
+                raise
+        print(f"git push rejected, rebasing (attempt {attempt}/{attempts})...")
+        token.wait(0.5 * attempt)
+        try:
+            _run(["git", "pull", "--rebase", "origin", branch], cwd=clone_dir, token=token)
+        except subprocess.CalledProcessError:
+            subprocess.run(["git", "rebase", "--abort"], cwd=clone_dir)
+            raise
     print("git pushed...")
 
-    # Trigger Render deployment
-    headers = {
-        "Authorization": f"Bearer {render_api_key}",
+
+def _render_headers(settings: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {settings['render_api_key']}",
         "Accept": "application/json",
         "Content-Type": "application/json",
     }
-    service_data = {
-        "serviceDetails": {
-            "name": service_name,
-            "type": "web_service",
-            "repo": {
-                "url": github_repo,
-                "branch": branch,
-            },
-            "env": "node",
-            "region": region,
-            "buildCommand": build_command,
-            "startCommand": start_command,
-            "autoDeploy": True,
-        }
+
+
+def _service_data(settings: Dict[str, Any], service_name: str, root_dir: str | None = None) -> Dict[str, Any]:
+    details = {
+        "name": service_name,
+        "type": "web_service",
+        "repo": {
+            "url": settings["github_repo"],
+            "branch": settings["branch"],
+        },
+        "env": "node",
+        "region": settings["region"],
+        "buildCommand": settings["build_command"],
+        "startCommand": settings["start_command"],
+        "autoDeploy": True,
     }
+    data = {"serviceDetails": details}
+    if root_dir:
+        # Top-level, as Render expects and as the update PATCH in _upsert_render_service sends it
+        data["rootDir"] = root_dir
+    return data
+
+
+def _response_body(resp: requests.Response) -> Any:
+    return resp.json() if resp.headers.get("content-type", "").startswith("application/json") else resp.text
 
-    resp = requests.post(
+
+def _subdir_name(project_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", project_name).strip(".-") or "project"
+
+
+def _upsert_render_service(
+    settings: Dict[str, Any],
+    service_name: str,
+    root_dir: str,
+    token: CancellationToken,
+) -> Dict[str, Any]:
+    """Points an existing Render service at `root_dir` and redeploys it, or creates the service."""
+    headers = _render_headers(settings)
+    found = requests.get(
         "https://api.render.com/v1/services",
         headers=headers,
-        data=json.dumps(service_data),
-        timeout=60,
+        params={"name": service_name, "limit": 1},
+        timeout=_request_timeout(token),
     )
+    # Treating a failed lookup as "not found" would create a duplicate service
+    if found.status_code != 200:
+        raise RuntimeError(f"Render service lookup failed: {found.status_code} {found.text}")
+    existing = found.json()
+    service = existing[0].get("service") if existing else None
 
-    result = {
-        "push": {
-            "repo": github_repo,
-            "branch": branch,
-        },
-        "render": {
-            "status_code": resp.status_code,
-            "body": resp.json() if resp.headers.get("content-type", "").startswith("application/json") else resp.text,
-        },
-    }
+    if service:
+        resp = requests.patch(
+            f"https://api.render.com/v1/services/{service['id']}",
+            headers=headers,
+            data=json.dumps({"rootDir": root_dir}),
+            timeout=_request_timeout(token),
+        )
+        if resp.status_code == 200:
+            resp = requests.post(
+                f"https://api.render.com/v1/services/{service['id']}/deploys",
+                headers=headers,
+                data=json.dumps({}),
+                timeout=_request_timeout(token),
+            )
+        action = "updated"
+    else:
+        resp = requests.post(
+            "https://api.render.com/v1/services",
+            headers=headers,
+            data=json.dumps(_service_data(settings, service_name, root_dir)),
+            timeout=_request_timeout(token),
+        )
+        action = "created"
 
-    if resp.status_code not in (200, 201):
+    if resp.status_code not in (200, 201, 202):
         raise RuntimeError(f"Render deployment failed: {resp.status_code} {resp.text}")
-    print(result)
-    return result
+    return {"action": action, "status_code": resp.status_code, "body": _response_body(resp)}
+
+
+def deploy_many_to_render(
+    projects: List[Dict[str, str]],
+    *,
+    token: CancellationToken | None = None,
+) -> Dict[str, Any]:
+    """
+    Deploys several projects to the shared fraxon-projects repo in one commit and one push,
+    each under its own subdirectory, then creates or updates their Render services concurrently.
+    `projects` items have "project_root" and optionally "project_name" and "service_name".
+    Returns the push details plus a per-project result; one project failing does not fail the rest.
+    Each project is registered as the run for "deploy:<name>", so a newer deploy of any of them
+    (single or batch) cancels this whole call, and this call supersedes older deploys of them.
+    """
+    print("START BATCH DEPLOY TO RENDER")
+    token = token or CancellationToken(timeout=float(os.getenv("DEPLOY_DEADLINE_SECONDS", "0")) or None)
+    settings = _settings()
+
+    results: List[Dict[str, Any]] = []
+    staged = []
+    for project in projects:
+        project_root = project["project_root"]
+        project_name = project.get("project_name") or os.path.basename(project_root.rstrip("/\\"))
+        result = {
+            "projectName": project_name,
+            "serviceName": project.get("service_name") or project_name,
+            "rootDir": _subdir_name(project_name),
+            "status": "pending",
+        }
+        if not os.path.isdir(project_root):
+            result.update(status="failed", error=f"Project path does not exist: {project_root}")
+        elif result["rootDir"] in {d for _, d in staged}:
+            result.update(status="failed", error=f"Duplicate project directory: {result['rootDir']}")
+        else:
+            staged.append((project_root, result["rootDir"]))
+        results.append(result)
+
+    push = {"repo": settings["github_repo"], "branch": settings["branch"]}
+    if not staged:
+        return {"push": push, "projects": results}
+
+    run_keys = [f"deploy:{r['projectName']}" for r in results if r["status"] == "pending"]
+    try:
+        for run_key in run_keys:
+            register_run(run_key, token)
+        return _push_and_deploy(settings, push, results, staged, token)
+    finally:
+        for run_key in run_keys:
+            release_run(run_key, token)
+
+
+def _push_and_deploy(
+    settings: Dict[str, Any],
+    push: Dict[str, Any],
+    results: List[Dict[str, Any]],
+    staged: List[tuple],
+    token: CancellationToken,
+) -> Dict[str, Any]:
+    clone_dir = tempfile.mkdtemp(prefix="fraxon_batch_")
+    try:
+        _clone_repo(settings, clone_dir, token)
+        # Only each project's own subdirectory is replaced; other projects in the repo are kept
+        for project_root, root_dir in staged:
+            target = os.path.join(clone_dir, root_dir)
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            _copy_tree(project_root, target, token)
+        names = ", ".join(d for _, d in staged)
+        _commit_and_push(clone_dir, settings["branch"], f"Deploy {len(staged)} apps: {names}", token)
+    except subprocess.CalledProcessError as e:
+        # Nothing reached the repo, so no Render service should be pointed at it
+        for result in results:
+            if result["status"] == "pending":
+                result.update(status="failed", error=f"git push failed: {e}")
+        print({"push": push, "projects": results})
+        return {"push": push, "projects": results}
+    finally:
+        shutil.rmtree(clone_dir, ignore_errors=True)
+
+    pending = [r for r in results if r["status"] == "pending"]
+
+    def deploy_one(result):
+        try:
+            result["render"] = _upsert_render_service(settings, result["serviceName"], result["rootDir"], token)
+            result["status"] = "deployed"
+        except GenerationCancelled:
+            # Superseded or past the deadline: the whole deploy is cancelled, not one failed project
+            result["status"] = "cancelled"
+            raise
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
 
+    workers = int(os.getenv("RENDER_DEPLOY_CONCURRENCY", "4"))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as pool:
+        # Iterating the results re-raises GenerationCancelled from any worker
+        list(pool.map(deploy_one, pending))
 
+    print({"push": push, "projects": results})
+    return {"push": push, "projects": results}
@@ -30,5 +30,16 @@ def clean_llm_code_output(raw_code):
     # If no markdown block is found, assume the whole string is code and strip it
     return raw_code.strip()
 
+def is_safe_project_name(name):
+    """Checks that a project name can be used as one directory under projects/, e.g. "My Blog API"."""
+    return (
+        isinstance(name, str)
+        and len(name) <= 100
+        and name.strip() != ""
+        # Rules out ".", ".." and hidden directories
+        and not name.startswith(".")
+        and not any(c in "/\\" or c == os.sep or ord(c) < 32 for c in name)
+    )
+
 def hello():
     print("Hello World!")
\ No newline at end of file